@@ -417,6 +417,8 @@ class PageView(QGraphicsView):
                 scale_x = rect.width() / cropped.width()
                 scale_y = rect.height() / cropped.height()
                 for word in parser.find_words():
+                    if word.bbox is None:
+                        continue
                     # expand word.id to avoid collisions
                     # assume that word.id has the pattern "word_[0-9]+_[0-9]+"
                     word.id = word.id[:5] + parse_id + word.id[4:]
@@ -678,6 +680,8 @@ class HocrEditor(QMainWindow):
             break # stop after first page
 
         for word in self.parser.find_words():
+            if word.bbox is None:
+                continue
             item = WordItem(
                 word,
                 word_selected_cb=self.on_word_selected,
@@ -698,6 +702,8 @@ class HocrEditor(QMainWindow):
             return
         new_words = dict()
         for word in self.parser.find_words():
+            if word.bbox is None:
+                continue
             if not word.id in new_words:
                 new_words[word.id] = list()
             new_words[word.id].append(word)
@@ -808,10 +814,8 @@ class HocrEditor(QMainWindow):
         if self.source_editor.editor.hasFocus():
             return
         # Convert byte offsets to character offsets
-        start_char = len(self.parser.source_bytes[:word_item.word.text_range[0]].decode(
-            self.parser.source_encoding, errors="replace"))
-        end_char = start_char + len(word_item.word.text.decode(
-            self.parser.source_encoding, errors="replace"))
+        start_char = self.source_editor.editor.char_position(word_item.word.text_range[0])
+        end_char = self.source_editor.editor.char_position(word_item.word.text_range[1])
 
         # Set selection
         cursor = self.source_editor.editor.textCursor()
@@ -917,7 +921,7 @@ class HocrEditor(QMainWindow):
         # this is needed to actually remove words
         # TODO incremental update
         self.words = self.parser.find_words()
-        words = self.words
+        words = [w for w in self.words if w.bbox is not None]
         lines = group_words_into_lines(words, y_threshold=50)
         line_idx, word_idx = find_insert_line_and_index(new_word.bbox, lines)
 
@@ -955,8 +959,8 @@ class HocrEditor(QMainWindow):
 
         lines_in_source.insert(insert_line, new_span_line)
         new_source = b"\n".join(lines_in_source)
+        # also sets the parser source
         self.source_editor.editor.setBytes(new_source)
-        self.parser.set_source_bytes(new_source)
         self.refresh_page_view()
 
         # Place cursor inside new span
@@ -1034,10 +1038,13 @@ class HocrEditor(QMainWindow):
         if not self.hocr_file:
             self.save_hocr_as()
             return
+        self.source_editor.editor.flush_sync()
+        # save what the user sees. toBytes also resyncs the parser if it differs
+        source_bytes = self.source_editor.editor.toBytes()
         try:
             with open(self.hocr_file, "wb") as f:
-                f.write(self.parser.source_bytes)
-                if not self.parser.source_bytes.endswith(b"\n"):
+                f.write(source_bytes)
+                if not source_bytes.endswith(b"\n"):
                     f.write(b"\n")
             # QMessageBox.information(self, "Saved", f"File saved to {self.hocr_file}")
         except Exception as exc:
@@ -17,6 +17,10 @@ Usage:
     words = hp.find_words()  # list[Word]
     hp.update(word_id=words[0].id, text=b"NEW")
     hp.update(word_id=words[0].id, bbox=(10,20,100,60), x_wconf=95)
+    hp.batch_update([{"word_id": w.id, "x_wconf": 100} for w in words])  # one reparse
+    with hp.batch():  # one reparse on exit
+        hp.update(word_id=words[1].id, text=b"A")
+        hp.update(word_id=words[2].id, text=b"B")
     new_src = hp.source_bytes  # updated HTML/XML bytestring
 
 Notes:
@@ -29,7 +33,11 @@ Notes:
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from copy import copy
+from functools import lru_cache
 from typing import Dict, Iterable, List, Optional, Tuple
 from typing import (
     Any,
@@ -39,6 +47,14 @@ import traceback
 
 from tree_sitter import Parser
 from tree_sitter_language_pack import get_language
+try:
+    # tree-sitter >= 0.25
+    from tree_sitter import Query, QueryCursor
+except ImportError:
+    Query = QueryCursor = None
+
+# chunk size for the parser read callback
+READ_CHUNK_SIZE = 64 * 1024
 
 debug = False
 # debug = True
@@ -49,11 +65,74 @@ debug_word_id = None
 HTML_LANG = get_language("html")
 XML_LANG = get_language("xml")
 
+# shared by all HocrParser instances.
+# parsing is not thread safe, so dont call parse from multiple threads
+HTML_PARSER = Parser(HTML_LANG)
+XML_PARSER = Parser(XML_LANG)
+
+
+def _compile_query(lang, source: str):
+    """Return a compiled tree-sitter query, or None if this grammar does not support it."""
+    try:
+        if QueryCursor is None:
+            return lang.query(source)
+        return Query(lang, source)
+    except Exception as exc:
+        if debug:
+            print(f"_compile_query: failed to compile {source!r}: {exc}")
+        return None
+
+
+def _query_matches(query, node) -> List[Tuple[int, Dict[str, Any]]]:
+    if QueryCursor is None:
+        return query.matches(node)
+    return QueryCursor(query).matches(node)
+
+
+def _capture_node(captures: Dict[str, Any], name: str):
+    # tree-sitter >= 0.23 returns a list of nodes per capture name
+    node = captures[name]
+    return node[0] if isinstance(node, list) else node
+
+
+# candidate word elements.
+# the tag name is compared in python, so we dont depend on text predicates
+HTML_WORD_QUERY = _compile_query(HTML_LANG, "(element (start_tag (tag_name) @tag)) @element")
+XML_WORD_QUERY = _compile_query(XML_LANG, "(element (STag (Name) @tag)) @element")
+
+
+def _field_id(lang, name: str) -> Optional[int]:
+    """Return the field id for name, or None if this grammar has no such field."""
+    try:
+        return lang.field_id_for_name(name)
+    except Exception:
+        return None
+
+
+# attribute fields. resolved once, so we dont look up field names per node
+HTML_NAME_FIELD = _field_id(HTML_LANG, "name")
+HTML_VALUE_FIELD = _field_id(HTML_LANG, "value")
+XML_NAME_FIELD = _field_id(XML_LANG, "name")
+XML_VALUE_FIELD = _field_id(XML_LANG, "value")
+
 # ------------------------ utilities ------------------------
 
 
 _TITLE_BBOX_RE = re.compile(rb"bbox\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)", re.IGNORECASE)
 _TITLE_XWCONF_RE = re.compile(rb"x_wconf\s+(-?\d+)", re.IGNORECASE)
+# also accepts ";" between the bbox numbers
+_TITLE_FIELDS_RE = re.compile(
+    rb"bbox[;\s]+(-?\d+)[;\s]+(-?\d+)[;\s]+(-?\d+)[;\s]+(-?\d+)|x_wconf\s+(-?\d+)", re.IGNORECASE)
+_NON_WS_RE = re.compile(rb"\S")
+_ATTR_VALUE_UNSAFE_RE = re.compile(rb"[\"'<>&]")
+_TEXT_UNSAFE_RE = re.compile(rb"[<>&]")
+# keys of the changes for HocrParser.batch_update
+_BATCH_UPDATE_KEYS = frozenset(("word_id", "span_start", "text", "bbox", "x_wconf", "new_id"))
+# title fields which can be replaced in place by _splice_title_field
+_TITLE_FIELD_RES = {
+    "bbox": _TITLE_BBOX_RE,
+    "x_wconf": _TITLE_XWCONF_RE,
+}
 
 
 # dont let qt swallow python exceptions
@@ -94,42 +173,74 @@ def print_exceptions(func):
     return print_exceptions_wrapper
 
 
+# titles repeat, for example when a word is moved back and forth,
+# or when words are parsed again after a full reindex
+@lru_cache(maxsize=8192)
 def _parse_title(title_value: bytes):
     """Return (bbox_tuple_or_None, x_wconf_or_None) from the raw 'title' value (no quotes)."""
-    s = (title_value or b"").strip()
+    s = title_value or b""
+    # fast path: one pass over "key value...; key value..." fields
     bbox = None
     xw = None
-
-    m = _TITLE_BBOX_RE.search(s)
-    if m:
+    for field in s.split(b";"):
+        parts = field.split()
+        if not parts:
+            continue
+        key = parts[0]
         try:
-            bbox = tuple(map(int, m.groups()))
-        except Exception:
-            bbox = None
+            if key == b"bbox" and len(parts) == 5 and bbox is None:
+                bbox = (int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4]))
+            elif key == b"x_wconf" and len(parts) == 2 and xw is None:
+                xw = int(parts[1])
+        except ValueError:
+            pass
+    if bbox is None or (xw is None and b"x_wconf" in s.lower()):
+        # unusual syntax. use the slow parser
+        return _parse_title_re(s)
+    return bbox, xw
 
-    m2 = _TITLE_XWCONF_RE.search(s)
-    if m2:
-        try:
-            xw = int(m2.group(1))
-        except Exception:
-            xw = None
 
-    # Fallback: token scan if regex failed
-    if bbox is None and b"bbox" in s.lower():
-        try:
-            parts = re.split(rb"[;\s]+", s)
-            for i, p in enumerate(parts):
-                if p.lower() == b"bbox" and i + 4 < len(parts):
-                    bx = tuple(map(int, parts[i+1:i+5]))
-                    if len(bx) == 4:
-                        bbox = bx
-                        break
-        except Exception:
-            pass
+def _parse_title_re(title_value: bytes):
+    """Regex based _parse_title. Also handles unusual case and separators."""
+    s = title_value or b""
+    bbox = None
+    xw = None
+
+    # one scan for both fields. the first match of each field wins
+    for m in _TITLE_FIELDS_RE.finditer(s):
+        if m[1] is not None:
+            if bbox is None:
+                bbox = (int(m[1]), int(m[2]), int(m[3]), int(m[4]))
+        elif xw is None:
+            xw = int(m[5])
+        if bbox is not None and xw is not None:
+            break
 
     return bbox, xw
 
 
+def _splice_title_field(existing: bytes, field_re: re.Pattern, new_value: bytes) -> Optional[bytes]:
+    """Replace the value of one title field, keeping all other bytes of the title.
+    Returns None if the field was not found.
+    """
+    m = field_re.search(existing)
+    if not m:
+        return None
+    start, end = m.start(), m.end()
+    # dont match partial keys or values, like "x_bbox" or "x_wconf 95.5"
+    if start > 0 and existing[start-1] not in b"; \t\r\n":
+        return None
+    if end < len(existing) and existing[end] not in b"; \t\r\n":
+        return None
+    # dont keep extra tokens of a malformed field, like "bbox 1 2 3 4 5"
+    field_end = existing.find(b";", end)
+    if field_end == -1:
+        field_end = len(existing)
+    if existing[end:field_end].strip():
+        return None
+    return existing[:m.start(1)] + new_value + existing[m.end(m.lastindex):]
+
+
 @print_exceptions
 def _format_title(
         existing: bytes,
@@ -141,50 +252,133 @@ def _format_title(
     assert isinstance(existing, bytes)
     # print("_format_title existing", repr(existing))
     existing = existing or b""
+    def encode_val(val):
+        if isinstance(val, bytes):
+            return val
+        return str(val).encode("utf8")
+    if not kwargs:
+        return existing
+    # fast path: replace only the numbers of existing bbox/x_wconf fields
+    new_title = existing
+    for key, val in kwargs.items():
+        field_re = _TITLE_FIELD_RES.get(key)
+        if field_re is None:
+            new_title = None
+            break
+        if isinstance(val, (list, tuple)):
+            val = b" ".join(map(encode_val, val))
+        new_title = _splice_title_field(new_title, field_re, encode_val(val))
+        if new_title is None:
+            break
+    if new_title is not None:
+        if debug:
+            print(f"_format_title: {existing!r} -> {new_title!r}")
+        return new_title
+    # slow path: new fields. rebuild the title
     # title_items = [] # preserve duplicate keys
     title_dict = {}
     for part in existing.split(b";"):
-        key_val = re.split(rb"\s+", part.strip(), 1)
-        if len(key_val) == 1:
-            if key_val[0] == b"": continue # both key and val are empty
-            key_val.append(b"")
-        key, val = key_val
+        # bytes.split(None) also skips leading whitespace
+        key_val = part.split(None, 1)
+        if not key_val: continue # both key and val are empty
+        key = key_val[0]
+        val = key_val[1].rstrip() if len(key_val) == 2 else b""
         # title_items.append((key, val))
         title_dict[key] = val
-    # import json
-    # print("_format_title title_dict", json.dumps(title_dict, indent=2))
-    # print("_format_title kwargs", json.dumps(kwargs, indent=2))
-    @print_exceptions
-    def encode_val(val):
-        if isinstance(val, bytes):
-            return val
-        return str(val).encode("utf8")
     for key, val in kwargs.items():
         key = encode_val(key)
         if isinstance(val, (list, tuple)):
             val = b" ".join(map(encode_val, val))
         val = encode_val(val)
         title_dict[key] = val
-    new_title = b"; ".join([(key + b" " + val) for key, val in title_dict.items()])
+    new_title = b"; ".join(key + b" " + val for key, val in title_dict.items())
     if debug:
         print(f"_format_title: {existing!r} -> {new_title!r}")
     return new_title
 
 
-@dataclass
+# marks bbox and x_wconf which are not yet parsed from title_value
+_UNPARSED: Any = object()
+
+
 class Word:
-    id: bytes
-    text: bytes
-    bbox: Optional[Tuple[int, int, int, int]]
-    x_wconf: Optional[int]
-    # raw title value (without surrounding quotes)
-    title_value: Optional[bytes]
-    # precise byte ranges (start, end) in source_bytes
-    text_range: Tuple[int, int]
-    title_value_range: Tuple[int, int]
-    id_value_range: Tuple[int, int]
-    element_range: Tuple[int, int]
-    span_range: Tuple[int, int]
+    """
+    bbox and x_wconf are parsed from title_value on first access,
+    unless they are passed to the constructor or assigned.
+    """
+
+    __slots__ = (
+        "id", "text", "_bbox", "_x_wconf", "title_value",
+        "text_range", "title_value_range", "id_value_range", "element_range", "span_range",
+    )
+
+    def __init__(
+        self,
+        id: bytes,
+        text: bytes,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        x_wconf: Optional[int] = None,
+        # raw title value (without surrounding quotes)
+        title_value: Optional[bytes] = None,
+        # precise byte ranges (start, end) in source_bytes
+        text_range: Tuple[int, int] = (0, 0),
+        title_value_range: Tuple[int, int] = (0, 0),
+        id_value_range: Tuple[int, int] = (0, 0),
+        element_range: Tuple[int, int] = (0, 0),
+        span_range: Tuple[int, int] = (0, 0),
+    ):
+        self.id = id
+        self.text = text
+        self.title_value = title_value
+        self.text_range = text_range
+        self.title_value_range = title_value_range
+        self.id_value_range = id_value_range
+        self.element_range = element_range
+        self.span_range = span_range
+        self._bbox = _UNPARSED if bbox is None else bbox
+        self._x_wconf = _UNPARSED if x_wconf is None else x_wconf
+
+    def _parse_title_value(self):
+        bbox, xw = _parse_title(self.title_value)
+        if self._bbox is _UNPARSED:
+            self._bbox = bbox
+        if self._x_wconf is _UNPARSED:
+            self._x_wconf = xw
+
+    @property
+    def bbox(self) -> Optional[Tuple[int, int, int, int]]:
+        if self._bbox is _UNPARSED:
+            self._parse_title_value()
+        return self._bbox
+
+    @bbox.setter
+    def bbox(self, bbox: Optional[Tuple[int, int, int, int]]):
+        self._bbox = bbox
+
+    @property
+    def x_wconf(self) -> Optional[int]:
+        if self._x_wconf is _UNPARSED:
+            self._parse_title_value()
+        return self._x_wconf
+
+    @x_wconf.setter
+    def x_wconf(self, x_wconf: Optional[int]):
+        self._x_wconf = x_wconf
+
+    def set_title_value(self, title_value: Optional[bytes]):
+        """Set title_value and drop the parsed bbox and x_wconf."""
+        self.title_value = title_value
+        self._bbox = _UNPARSED
+        self._x_wconf = _UNPARSED
+
+    def __repr__(self):
+        return (
+            f"Word(id={self.id!r}, text={self.text!r}, bbox={self.bbox!r}, x_wconf={self.x_wconf!r}, "
+            f"title_value={self.title_value!r}, text_range={self.text_range!r}, "
+            f"title_value_range={self.title_value_range!r}, id_value_range={self.id_value_range!r}, "
+            f"element_range={self.element_range!r}, span_range={self.span_range!r})"
+        )
+
     # @print_exceptions
     # def __init__(self, *a, **k):
     #     super().__init__(*a, **k)
@@ -206,24 +400,31 @@ class HocrParser:
 
     @print_exceptions
     def find_words(self) -> List[Word]:
+        """Return the words by id. bbox is None for words with an unparseable title,
+        so callers which need a bbox should skip them."""
         return list(self._index_words().values())
 
     @print_exceptions
     def find_pages(self) -> List[Word]:
         pages = []
-        stack = [self.tree.root_node]
         sb = self.source_bytes
-        while stack:
-            n = stack.pop()
+        # walk with a cursor, so we dont build lists of children
+        cursor = self._root_node().walk()
+        while True:
+            n = cursor.node
+            page = None
             # Only consider element nodes
             if n.type in ("element", "html_element", "div"):
                 page = self._extract_page_node(n, sb)
                 if page:
                     pages.append(page)
-            stack.extend(n.children)
-        return pages
+            # pages dont contain pages
+            if page is None and cursor.goto_first_child():
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return pages
 
-    @print_exceptions
     def _extract_page_node(self, element, sb: bytes) -> Optional[Word]:
         # Get start tag or STag
         if self._lang == "html":
@@ -236,7 +437,7 @@ class HocrParser:
                     n,v,vr = self._read_html_attribute(c, sb)
                     if n: attrs[n] = (v,vr)
             cls_val = attrs.get(b"class", (b"", (0,0)))[0]
-            if b"ocr_page" not in cls_val.split(): return None
+            if not _class_has(cls_val, b"ocr_page"): return None
             title_val, title_range = attrs.get(b"title", (b"", (0,0)))
             bbox,_ = _parse_title(title_val)
             if not bbox: bbox=(0,0,0,0)
@@ -265,7 +466,7 @@ class HocrParser:
                     n,v,vr = self._read_xml_attribute(c, sb)
                     if n: attrs[n]=(v,vr)
             cls_val = attrs.get(b"class", (b"", (0,0)))[0]
-            if b"ocr_page" not in cls_val.split(): return None
+            if not _class_has(cls_val, b"ocr_page"): return None
             title_val, title_range = attrs.get(b"title", (b"", (0,0)))
             bbox,_ = _parse_title(title_val)
             if not bbox: bbox=(0,0,0,0)
@@ -303,47 +504,12 @@ class HocrParser:
         node = idx.get(word_id)
         if not node:
             return False
-
-        changed = False
-
-        # 1) text
-        if text is not None and node.text_range:
-            if debug_word_id and debug_word_id == word_id:
-                old_text = self.source_bytes[node.text_range[0]:node.text_range[1]]
-                print(f"word {word_id}: update: update text: {old_text!r} -> {text!r}")
-            self._replace_range(node.text_range, text)
-            changed = True
-            # reindex to refresh ranges after _replace_range
-            idx = self._index_words()
-            node = idx.get(word_id) or node
-
-        # 2) title merge (bbox/x_wconf)
-        if bbox is not None or x_wconf is not None:
-            current_title = self.source_bytes[node.title_value_range[0]:node.title_value_range[1]]
-            kwargs: dict[str, Any] = dict()
-            if bbox is not None: kwargs["bbox"] = bbox
-            if x_wconf is not None: kwargs["x_wconf"] = x_wconf
-            new_title = _format_title(current_title, **kwargs)
-            if debug_word_id and debug_word_id == word_id:
-                if current_title == new_title:
-                    print(f"word {word_id}: update: update title: no change in attribute @ {node.title_value_range}: title = {current_title!r}")
-                else:
-                    print(f"word {word_id}: update: update title: attribute @ {node.title_value_range}: title = {current_title!r}")
-                    print(f"word {word_id}: update: update title: {current_title!r} -> {new_title!r}")
-            # FIXME preserve the old x_wconf value (and all other semicolon-separated values in title)
-            if new_title != current_title:
-                self._replace_range(node.title_value_range, new_title)
-                changed = True
-                # reindex to refresh ranges after _replace_range
-                idx = self._index_words()
-                node = idx.get(word_id) or node
-
-        # 3) id change
-        if new_id is not None and new_id != node.id:
-            self._replace_range(node.id_value_range, new_id)
-            changed = True
-
-        return changed
+        # apply all edits in one pass, with one reparse
+        edits = self._word_edits(node, text=text, bbox=bbox, x_wconf=x_wconf, new_id=new_id)
+        if not edits:
+            return False
+        self._replace_ranges(edits)
+        return True
 
     @print_exceptions
     def update_by_span(
@@ -363,20 +529,126 @@ class HocrParser:
         if not word:
             return False
 
-        changed = False
+        if text is not None and word.text_range:
+            old_text = bytes(self._buf[word.text_range[0]:word.text_range[1]])
+            print(f"word {word.id}: update_by_span: update text (by span): {old_text!r} -> {text!r}")
+
+        edits = self._word_edits(word, text=text, bbox=bbox, x_wconf=x_wconf, new_id=new_id, caller="update_by_span")
+        if not edits:
+            return False
+        self._replace_ranges(edits)
+        return True
+
+    @print_exceptions
+    def batch_update(self, changes: Iterable[Dict[str, Any]]) -> int:
+        """Apply changes to many words with one reparse.
+        Each change is a dict with "word_id" or "span_start",
+        plus the keyword arguments of update: text, bbox, x_wconf, new_id.
+        Every word can be changed only once per batch.
+        Returns the number of changed words.
+        Raises ValueError for unknown keys, before any word is changed.
+        """
+        changes = list(changes)
+        for change in changes:
+            unknown = change.keys() - _BATCH_UPDATE_KEYS
+            if unknown:
+                raise ValueError(f"batch_update: unknown keys {sorted(unknown)!r} in change {change!r}")
+        idx = self._index_words()
+        edits: List[Tuple[Tuple[int, int], bytes]] = []
+        changed = 0
+        for change in changes:
+            span_start = change.get("span_start")
+            if span_start is not None:
+                word = self._word_by_span_start(span_start)
+            else:
+                word = idx.get(change.get("word_id"))
+            if not word:
+                continue
+            word_edits = self._word_edits(
+                word,
+                text=change.get("text"),
+                bbox=change.get("bbox"),
+                x_wconf=change.get("x_wconf"),
+                new_id=change.get("new_id"),
+                caller="batch_update",
+            )
+            if word_edits:
+                edits.extend(word_edits)
+                changed += 1
+        if edits:
+            self._replace_ranges(edits)
+        return changed
+
+    @contextmanager
+    def batch(self):
+        """Collect the edits of update, update_by_span and batch_update,
+        and apply them with one reparse on exit.
+        Inside the batch, words and source_bytes still have the old values,
+        and every word can be changed only once.
+        """
+        if self._pending_edits is not None:
+            # nested batch
+            yield
+            return
+        self._pending_edits = []
+        try:
+            yield
+            edits = self._pending_edits
+        finally:
+            self._pending_edits = None
+        if edits:
+            self._replace_ranges(edits)
+
+    @print_exceptions
+    def apply_edit(self, start_byte: int, old_end_byte: int, new_bytes: bytes):
+        """Replace source_bytes[start_byte:old_end_byte] with new_bytes.
+        For editors which mirror their edits to the parser:
+        the tree is reparsed incrementally and the word index is patched.
+        """
+        self._replace_ranges([((start_byte, old_end_byte), new_bytes)])
+
+    @print_exceptions
+    def line_offset(self, row: int) -> int:
+        """Return the byte offset of the start of line row in source_bytes."""
+        if row == 0:
+            return 0
+        return self._newline(row - 1) + 1
+
+    @print_exceptions
+    def line(self, row: int) -> bytes:
+        """Return line row of source_bytes, without the newline."""
+        start = 0 if row == 0 else self._newline(row - 1) + 1
+        end = self._newline(row) if row < len(self._newlines) else len(self._buf)
+        return bytes(self._buf[start:end])
+
+    @print_exceptions
+    def point(self, offset: int) -> Tuple[int, int]:
+        """Return the (row, byte column) of a byte offset in source_bytes."""
+        return self._point(offset)
+
+    def _word_edits(
+            self,
+            word: Word,
+            *,
+            text: Optional[str] = None,
+            bbox: Optional[Tuple[int, int, int, int]] = None,
+            x_wconf: Optional[int] = None,
+            new_id: Optional[str] = None,
+            caller: str = "update",
+        ) -> List[Tuple[Tuple[int, int], bytes]]:
+        """Collect the (byte_range, new_bytes) edits for one word, against its current ranges."""
+        edits: List[Tuple[Tuple[int, int], bytes]] = []
 
         # 1) text
         if text is not None and word.text_range:
-            old_text = self.source_bytes[word.text_range[0]:word.text_range[1]]
-            print(f"word {word.id}: update_by_span: update text (by span): {old_text!r} -> {text!r}")
-            self._replace_range(word.text_range, text)
-            changed = True
-            # re-find word after parse
-            word = self.find_word_by_span_start(span_start) or word
+            if debug_word_id and debug_word_id == word.id:
+                old_text = bytes(self._buf[word.text_range[0]:word.text_range[1]])
+                print(f"word {word.id}: {caller}: update text: {old_text!r} -> {text!r}")
+            edits.append((word.text_range, text))
 
         # 2) title merge (bbox/x_wconf)
         if bbox is not None or x_wconf is not None:
-            current_title = self.source_bytes[word.title_value_range[0]:word.title_value_range[1]]
+            current_title = bytes(self._buf[word.title_value_range[0]:word.title_value_range[1]])
             kwargs: dict[str, Any] = {}
             if bbox is not None:
                 kwargs["bbox"] = bbox
@@ -385,28 +657,29 @@ class HocrParser:
             new_title = _format_title(current_title, **kwargs)
             if current_title == new_title:
                 if debug_word_id and debug_word_id == word.id:
-                    print(f"word {word.id}: update_by_span: update title: no change in attribute @ {word.title_value_range}: title = {current_title!r}")
+                    print(f"word {word.id}: {caller}: update title: no change in attribute @ {word.title_value_range}: title = {current_title!r}")
             else:
                 if debug_word_id and debug_word_id == word.id:
-                    print(f"word {word.id}: update_by_span: update title: attribute @ {word.title_value_range}: title = {current_title!r}")
-                    print(f"word {word.id}: update_by_span: update title: {current_title!r} -> {new_title!r}")
-                self._replace_range(word.title_value_range, new_title)
-                changed = True
-                word = self.find_word_by_span_start(span_start) or word
+                    print(f"word {word.id}: {caller}: update title: attribute @ {word.title_value_range}: title = {current_title!r}")
+                    print(f"word {word.id}: {caller}: update title: {current_title!r} -> {new_title!r}")
+                edits.append((word.title_value_range, new_title))
 
         # 3) id change
         if new_id is not None and new_id != word.id:
-            self._replace_range(word.id_value_range, new_id)
-            changed = True
+            edits.append((word.id_value_range, new_id))
 
-        return changed
+        return edits
 
     @print_exceptions
     def find_word_by_span_start(self, span_start: int) -> Optional[Word]:
         """Return the Word whose span_range[0] equals span_start (or None)."""
-        for w in self.find_words():
-            if w.span_range and w.span_range[0] == span_start:
-                return w
+        self._index_words()
+        return self._word_by_span_start(span_start)
+
+    def _word_by_span_start(self, span_start: int) -> Optional[Word]:
+        i = bisect_left(self._span_starts, span_start)
+        if i < len(self._span_starts) and self._span_starts[i] == span_start:
+            return self._words_sorted[i]
         return None
 
     # ------------------------ core ------------------------
@@ -414,13 +687,46 @@ class HocrParser:
     @print_exceptions
     def set_source_bytes(self, source_bytes: bytes, source_encoding="utf-8"):
         assert isinstance(source_bytes, bytes)
-        self.source_bytes = source_bytes
+        # edits are applied in place to _buf. source_bytes is a cached copy
+        self._buf = bytearray(source_bytes)
+        self._source_bytes: Optional[bytes] = source_bytes
+        # (encoding, string) from get_source_string. cached until the next edit
+        self._source_string: Optional[Tuple[str, str]] = None
         self.source_encoding = source_encoding
         self._lang = _detect_lang(self.source_bytes)
-        lang = XML_LANG if self._lang == "xml" else HTML_LANG
-        self.parser = Parser(lang)
+        # the grammar does not change until the next set_source_bytes
+        if self._lang == "xml":
+            self.parser = XML_PARSER
+            self._word_query = XML_WORD_QUERY
+            self._extract_word = self._extract_word_xml
+        else:
+            self.parser = HTML_PARSER
+            self._word_query = HTML_WORD_QUERY
+            self._extract_word = self._extract_word_html
         self.tree = self.parser.parse(self.source_bytes)
+        # True after edits which were applied with tree.edit, but not yet reparsed
+        self._tree_stale = False
+        # edits collected by batch(). None when not in a batch
+        self._pending_edits: Optional[List[Tuple[Tuple[int, int], bytes]]] = None
+        # sorted byte offsets of b"\n", to get row/column points for tree.edit
+        self._newlines = _newline_offsets(self.source_bytes)
+        # lazy shift of the newline offsets: _newlines[i] + _newlines_delta for i >= _newlines_from.
+        # so typing on one line does not shift all following newlines
+        self._newlines_from = 0
+        self._newlines_delta = 0
         self._cached_index: Optional[Dict[bytes, Word]] = None
+        # number of words per id, to find duplicate ids. built together with _cached_index
+        self._id_counts: Dict[bytes, int] = {}
+        # words sorted by span start, with parallel arrays of span starts and ends
+        self._words_sorted: List[Word] = []
+        self._span_starts = array("q")
+        self._span_ends = array("q")
+
+    @property
+    def source_bytes(self) -> bytes:
+        if self._source_bytes is None:
+            self._source_bytes = bytes(self._buf)
+        return self._source_bytes
 
     @print_exceptions
     def set_source_string(self, source: str, encoding=None):
@@ -432,77 +738,169 @@ class HocrParser:
     @print_exceptions
     def get_source_string(self, encoding=None) -> str:
         encoding = encoding or self.source_encoding
+        if self._source_string is not None and self._source_string[0] == encoding:
+            return self._source_string[1]
         source = self.source_bytes.decode(encoding, errors="replace")
+        self._source_string = (encoding, source)
         return source
 
-    @print_exceptions
     def _index_words(self) -> Dict[bytes, Word]:
         if self._cached_index is not None:
             return self._cached_index
-        words: dict[bytes, Word] = {}
-        root = self.tree.root_node
-        stack = [root]
-        sb = self.source_bytes
-        while stack:
-            n = stack.pop()
-            if self._lang == "html":
-                if n.type == "element":
-                    w = self._extract_word_html(n, sb)
-                    if w:
-                        words[w.id] = w
-            else:  # xml
-                if n.type == "element":
-                    w = self._extract_word_xml(n, sb)
-                    if w:
-                        words[w.id] = w
-            # DFS
-            stack.extend(n.children)
+        # also has words with duplicate ids
+        words_sorted = list(self._iter_words(self.source_bytes))
+        # query matches should already be in document order, then this sort is linear
+        words_sorted.sort(key=_span_start)
+        return self._set_index(words_sorted)
+
+    def _set_index(self, words_sorted: List[Word]) -> Dict[bytes, Word]:
+        """Build all word lookups from words_sorted, which are in document order."""
+        words: Dict[bytes, Word] = {}
+        id_counts: Dict[bytes, int] = {}
+        for w in words_sorted:
+            # on duplicate ids, the first word wins
+            words.setdefault(w.id, w)
+            id_counts[w.id] = id_counts.get(w.id, 0) + 1
+        self._words_sorted = words_sorted
+        self._span_starts = array("q", [w.span_range[0] for w in words_sorted])
+        self._span_ends = array("q", [w.span_range[1] for w in words_sorted])
+        self._id_counts = id_counts
         self._cached_index = words
         return words
 
+    def _update_id_index(self, old_words: List[Word], new_words: List[Word]):
+        """Update the lookup by id after old_words were replaced with new_words in _words_sorted.
+        new_words must be in document order.
+        """
+        words = self._cached_index
+        id_counts = self._id_counts
+        lost_ids = set()
+        for w in old_words:
+            id_counts[w.id] -= 1
+            if words.get(w.id) is w:
+                del words[w.id]
+                lost_ids.add(w.id)
+        new_counts: Dict[bytes, int] = {}
+        for w in new_words:
+            id_counts[w.id] = id_counts.get(w.id, 0) + 1
+            new_counts[w.id] = new_counts.get(w.id, 0) + 1
+            if w.id in lost_ids:
+                # an unchanged word can come before w. resolved below
+                continue
+            first = words.get(w.id)
+            # on duplicate ids, the first word wins
+            if first is None or w.span_range[0] < first.span_range[0]:
+                words[w.id] = w
+        for w in old_words:
+            if id_counts.get(w.id) == 0:
+                del id_counts[w.id]
+        scan_ids = set()
+        for i in lost_ids:
+            if i not in id_counts:
+                continue
+            if id_counts[i] == new_counts.get(i, 0):
+                # only new words have this id
+                words[i] = next(w for w in new_words if w.id == i)
+            else:
+                scan_ids.add(i)
+        if scan_ids:
+            # a duplicate id lost its first word. find the next one
+            for w in self._words_sorted:
+                if w.id in scan_ids:
+                    words.setdefault(w.id, w)
+
+    def _iter_words(self, sb: bytes, root=None) -> Iterable[Word]:
+        """Yield all words in document order, optionally only below a root node."""
+        if root is None:
+            root = self._root_node()
+        query = self._word_query
+        extract_word = self._extract_word
+        if query is not None:
+            # let tree-sitter find the elements, so python only sees element nodes
+            for _pattern_index, captures in _query_matches(query, root):
+                tag = _capture_node(captures, "tag")
+                if sb[tag.start_byte:tag.end_byte].lower() != b"span":
+                    continue
+                w = extract_word(_capture_node(captures, "element"), sb)
+                if w:
+                    yield w
+            return
+        # fallback: walk all nodes with a cursor, so we dont build lists of children
+        cursor = root.walk()
+        while True:
+            n = cursor.node
+            w = None
+            if n.type == "element":
+                w = extract_word(n, sb)
+                if w:
+                    yield w
+            # words dont contain words
+            if w is None and cursor.goto_first_child():
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return
+
     # ------------------------ extraction: HTML ------------------------
 
-    @print_exceptions
     def _extract_word_html(self, element, sb: bytes) -> Optional[Word]:
         # element = start_tag, (text|element)*, end_tag
         # Find start_tag
-        if not element.children or element.children[0].type != "start_tag":
+        # child(i) instead of children, so we dont build lists of nodes for every element
+        child_count = element.child_count
+        if not child_count:
+            return None
+        start_tag = element.child(0)
+        if start_tag.type != "start_tag":
             return None
-        start_tag = element.children[0]
 
         tag_name = None
-        attrs: dict[bytes, Tuple[bytes, Tuple[int, int]]] = {}
+        cls_val = id_val = title_val = b""
+        id_range = title_range = (0, 0)
+        id_node = title_node = None
 
-        for ch in start_tag.children:
+        # only read the values of class, id and title
+        for i in range(start_tag.child_count):
+            ch = start_tag.child(i)
             t = ch.type
             if t == "tag_name":
                 tag_name = sb[ch.start_byte:ch.end_byte]
+                if tag_name.lower() != b"span":
+                    return None
             elif t == "attribute":
-                n, v, vr = self._read_html_attribute(ch, sb)
-                if n:
-                    attrs[n] = (v, vr)
-
-        if (tag_name or b"").lower() != b"span":
+                name_node, value_node = self._html_attribute_nodes(ch)
+                if not name_node or not value_node:
+                    continue
+                n = sb[name_node.start_byte:name_node.end_byte]
+                if n == b"class":
+                    cls_val, _ = _read_attribute_value(value_node, sb)
+                elif n == b"id":
+                    id_node = value_node
+                elif n == b"title":
+                    title_node = value_node
+
+        if tag_name is None:
             return None
-        cls_val = attrs.get(b"class", (b"", (0, 0)))[0]
         if not _class_has(cls_val, b"ocrx_word"):
             return None
-
-        # id & title
-        id_val, id_range = attrs.get(b"id", (b"", (0, 0)))
-        title_val, title_range = attrs.get(b"title", (b"", (0, 0)))
+        # most spans are lines etc, so read id and title only for words
+        if id_node is not None:
+            id_val, id_range = _read_attribute_value(id_node, sb)
+        if title_node is not None:
+            title_val, title_range = _read_attribute_value(title_node, sb)
 
         if debug_word_id and debug_word_id == id_val:
-            for n, (v, vr) in attrs.items():
-                print(f"_extract_word_html: attribute @ {vr}: {n} = {v!r}")
+            print(f"_extract_word_html: attribute @ {id_range}: id = {id_val!r}")
+            print(f"_extract_word_html: attribute @ {title_range}: title = {title_val!r}")
 
         # inner text: first 'text' child directly under element
         text_node = None
-        for ch in element.children:
+        for i in range(1, child_count):
+            ch = element.child(i)
             if ch.type == "text":
                 text_node = ch
                 break
-        end_tag = element.children[-1]
+        end_tag = element.child(child_count - 1)
         if text_node is not None:
             text = sb[text_node.start_byte:text_node.end_byte]
             text_range = (text_node.start_byte, text_node.end_byte)
@@ -511,16 +909,10 @@ class HocrParser:
             text = b""
             text_range = (end_tag.start_byte, end_tag.start_byte)
 
-        bbox, xw = _parse_title(title_val)
-        if bbox is None:
-            print(f"word {id_val!r}: failed to parse bbox from title {title_val!r}")
-            return None
-        assert not (bbox is None), f"word {id_val!r}: failed to parse bbox from title {title_val!r}"
+        # bbox and x_wconf are parsed on demand
         return Word(
             id=id_val,
             text=text,
-            bbox=bbox,
-            x_wconf=xw,
             title_value=title_val,
             text_range=text_range,
             title_value_range=title_range,
@@ -529,14 +921,24 @@ class HocrParser:
             span_range=(start_tag.start_byte, end_tag.end_byte),
         )
 
-    @print_exceptions
     def _read_html_attribute(self, attr_node, sb: bytes) -> Tuple[Optional[bytes], bytes, Tuple[int, int]]:
         """
         Returns (name, value_without_quotes, inner_range) for HTML grammar.
+        """
+        name_node, value_node = self._html_attribute_nodes(attr_node)
+        if not name_node or not value_node:
+            return None, b"", (attr_node.start_byte, attr_node.start_byte)
+        name = sb[name_node.start_byte:name_node.end_byte]
+        value, value_range = _read_attribute_value(value_node, sb)
+        return name, value, value_range
+
+    def _html_attribute_nodes(self, attr_node):
+        """
+        Returns (name_node, value_node) for HTML grammar.
         Handles multiple possible child node type names across html grammars.
         """
-        name_node = getattr(attr_node, "child_by_field_name", lambda *_: None)("name")
-        value_node = getattr(attr_node, "child_by_field_name", lambda *_: None)("value")
+        name_node = attr_node.child_by_field_id(HTML_NAME_FIELD) if HTML_NAME_FIELD is not None else None
+        value_node = attr_node.child_by_field_id(HTML_VALUE_FIELD) if HTML_VALUE_FIELD is not None else None
 
         if not name_node or not value_node:
             # Fallback: scan children for common node type names
@@ -545,79 +947,92 @@ class HocrParser:
                     name_node = c
                 if not value_node and c.type in ("quoted_attribute_value", "attribute_value", "unquoted_attribute_value", "string"):
                     value_node = c
-
-        if not name_node or not value_node:
-            return None, b"", (attr_node.start_byte, attr_node.start_byte)
-
-        name = sb[name_node.start_byte:name_node.end_byte]
-        raw = sb[value_node.start_byte:value_node.end_byte]
-
-        inner_start, inner_end = _strip_quote_range(value_node.start_byte, value_node.end_byte, raw)
-        value = sb[inner_start:inner_end]
-        return name, value, (inner_start, inner_end)
+        return name_node, value_node
 
     # ------------------------ extraction: XML ------------------------
 
-    @print_exceptions
     def _extract_word_xml(self, element, sb: bytes) -> Optional[Word]:
         # element -> STag, content?, ETag | EmptyElemTag
-        # TODO rename to start_tags
-        stags = [c for c in element.children if c.type == "STag"]
-        if not stags:
-            return None
+        # child(i) instead of children, so we dont build lists of nodes for every element
+        child_count = element.child_count
         # TODO rename to start_tag
-        st = stags[0]
+        st = None
+        st_index = 0
+        for st_index in range(child_count):
+            c = element.child(st_index)
+            if c.type == "STag":
+                st = c
+                break
+        if st is None:
+            return None
 
         tag_name = None
-        attrs: dict[bytes, Tuple[bytes, Tuple[int, int]]] = {}
-        for c in st.children:
-            if c.type == "Name" and tag_name is None:
+        cls_val = id_val = title_val = b""
+        id_range = title_range = (0, 0)
+        id_node = title_node = None
+
+        # only read the values of class, id and title
+        for i in range(st.child_count):
+            c = st.child(i)
+            t = c.type
+            if t == "Name" and tag_name is None:
                 tag_name = sb[c.start_byte:c.end_byte]
-            elif c.type == "Attribute":
-                n, v, vr = self._read_xml_attribute(c, sb)
-                if n:
-                    attrs[n] = (v, vr)
-
-        if (tag_name or b"").lower() != b"span":
+                if tag_name.lower() != b"span":
+                    return None
+            elif t == "Attribute":
+                name_node, value_node = self._xml_attribute_nodes(c)
+                if not name_node or not value_node:
+                    continue
+                n = sb[name_node.start_byte:name_node.end_byte]
+                if n == b"class":
+                    cls_val, _ = _read_attribute_value(value_node, sb)
+                elif n == b"id":
+                    id_node = value_node
+                elif n == b"title":
+                    title_node = value_node
+
+        if tag_name is None:
             return None
-        cls_val = attrs.get(b"class", (b"", (0, 0)))[0]
         if not _class_has(cls_val, b"ocrx_word"):
             return None
-
-        id_val, id_range = attrs.get(b"id", (b"", (0, 0)))
-        title_val, title_range = attrs.get(b"title", (b"", (0, 0)))
+        # most spans are lines etc, so read id and title only for words
+        if id_node is not None:
+            id_val, id_range = _read_attribute_value(id_node, sb)
+        if title_node is not None:
+            title_val, title_range = _read_attribute_value(title_node, sb)
 
         if debug_word_id and debug_word_id == id_val:
-            for n, (v, vr) in attrs.items():
-                print(f"_extract_word_xml: attribute @ {vr}: {n} = {v!r}")
+            print(f"_extract_word_xml: attribute @ {id_range}: id = {id_val!r}")
+            print(f"_extract_word_xml: attribute @ {title_range}: title = {title_val!r}")
 
         # content text
         text = b""
         text_range: Tuple[int, int] = (element.start_byte, element.start_byte)
-        contents = [c for c in element.children if c.type == "content"]
-        if contents:
+        # content comes after STag, so dont look at the children before it again
+        content = None
+        for i in range(st_index + 1, child_count):
+            c = element.child(i)
+            if c.type == "content":
+                content = c
+                break
+        if content is not None:
             # find first CharData as text node
-            for sub in contents[0].children:
+            for i in range(content.child_count):
+                sub = content.child(i)
                 if sub.type == "CharData":
                     text = sb[sub.start_byte:sub.end_byte]
                     text_range = (sub.start_byte, sub.end_byte)
                     break
 
-        end_tag = element.children[-1]
+        end_tag = element.child(child_count - 1)
         if end_tag.type != "ETag":
             print(f"FIXME not found end_tag (ETag) in element.children:\n  {'\n  '.join(map(repr, element.children))}")
             return None
 
-        bbox, xw = _parse_title(title_val)
-        if bbox is None:
-            print(f"word {id_val!r}: failed to parse bbox from title {title_val!r}")
-            return None
-        assert not (bbox is None), f"word {id_val!r}: failed to parse bbox from title {title_val!r}"
+        # bbox and x_wconf are parsed on demand
         return Word(
             id=id_val,
             text=text,
-            bbox=bbox,
-            x_wconf=xw,
             title_value=title_val,
             text_range=text_range,
             title_value_range=title_range,
@@ -626,17 +1041,23 @@ class HocrParser:
             span_range=(st.start_byte, end_tag.end_byte),
         )
 
-    @print_exceptions
     def _read_xml_attribute(self, attr_node, sb: bytes) -> Tuple[Optional[bytes], bytes, Tuple[int, int]]:
         """
         Returns (name, value_without_quotes, inner_range) for XML grammar (tree-sitter-xml).
         """
-        name_node = None
-        value_node = None
+        name_node, value_node = self._xml_attribute_nodes(attr_node)
+        if not name_node or not value_node:
+            return None, b"", (attr_node.start_byte, attr_node.start_byte)
+        name = sb[name_node.start_byte:name_node.end_byte]
+        value, value_range = _read_attribute_value(value_node, sb)
+        return name, value, value_range
 
-        if hasattr(attr_node, "child_by_field_name"):
-            name_node = attr_node.child_by_field_name("name") or None
-            value_node = attr_node.child_by_field_name("value") or None
+    def _xml_attribute_nodes(self, attr_node):
+        """
+        Returns (name_node, value_node) for XML grammar (tree-sitter-xml).
+        """
+        name_node = attr_node.child_by_field_id(XML_NAME_FIELD) if XML_NAME_FIELD is not None else None
+        value_node = attr_node.child_by_field_id(XML_VALUE_FIELD) if XML_VALUE_FIELD is not None else None
 
         if not name_node or not value_node:
             for c in attr_node.children:
@@ -644,41 +1065,357 @@ class HocrParser:
                     name_node = c
                 if not value_node and c.type in ("AttValue", "AttributeValue"):
                     value_node = c
-
-        if not name_node or not value_node:
-            return None, b"", (attr_node.start_byte, attr_node.start_byte)
-
-        name = sb[name_node.start_byte:name_node.end_byte]
-        raw = sb[value_node.start_byte:value_node.end_byte]
-
-        inner_start, inner_end = _strip_quote_range(value_node.start_byte, value_node.end_byte, raw)
-        value = sb[inner_start:inner_end]
-        return name, value, (inner_start, inner_end)
+        return name_node, value_node
 
     # ------------------------ editing ------------------------
 
-    @print_exceptions
     def _replace_range(self, byte_range: Tuple[int, int], new_bytes: bytes):
-        assert isinstance(new_bytes, bytes)
-        assert isinstance(self.source_bytes, bytes)
-        start, end = byte_range
+        self._replace_ranges([(byte_range, new_bytes)])
+
+    def _replace_ranges(self, edits: List[Tuple[Tuple[int, int], bytes]]):
+        """Apply multiple (byte_range, new_bytes) edits with one reparse.
+        All ranges refer to the current source_bytes and must not overlap.
+        Raises ValueError for overlapping edits, before anything is applied or queued.
+        """
+        # right-to-left, so the offsets of the remaining edits stay valid
+        edits = self._sorted_edits(edits)
+        if self._pending_edits is not None:
+            # in batch(). apply on exit
+            self._queue_edits(edits)
+            return
         if debug:
-            old_bytes = self.source_bytes[start:end]
-            print(f"_replace_range: range {byte_range}: {old_bytes!r} -> {new_bytes!r}")
-        before = self.source_bytes[:start]
-        after = self.source_bytes[end:]
-        insert = new_bytes
-        self.source_bytes = before + insert + after
-        # Reparse and clear cache
-        self.tree = self.parser.parse(self.source_bytes)
-        self._cached_index = None
+            for (start, end), new_bytes in edits:
+                old_bytes = bytes(self._buf[start:end])
+                print(f"_replace_ranges: range {(start, end)}: {old_bytes!r} -> {new_bytes!r}")
+        if self._replace_without_reparse(edits):
+            return
+        self._apply_edits(edits)
+        # Reparse, reusing unchanged subtrees.
+        # read from the buffer, so we dont need a bytes copy of the source
+        old_tree = self.tree
+        self.tree = self.parser.parse(self._read, old_tree)
+        self._tree_stale = False
+        if self._cached_index is not None:
+            self._patch_index(edits, old_tree.changed_ranges(self.tree))
+
+    def _sorted_edits(self, edits: List[Tuple[Tuple[int, int], bytes]]) -> List[Tuple[Tuple[int, int], bytes]]:
+        """Return the edits sorted right-to-left.
+        Raises ValueError if they overlap or are out of range.
+        """
+        edits = sorted(edits, key=lambda edit: edit[0], reverse=True)
+        prev_start = len(self._buf)
+        for (start, end), new_bytes in edits:
+            if not isinstance(new_bytes, bytes):
+                raise TypeError(f"edit at {(start, end)}: expected bytes, got {type(new_bytes).__name__}")
+            if not 0 <= start <= end <= prev_start:
+                raise ValueError(f"overlapping or out of range edit at {(start, end)}")
+            prev_start = start
+        return edits
+
+    def _queue_edits(self, edits: List[Tuple[Tuple[int, int], bytes]]):
+        """Add validated edits to the pending edits of batch().
+        Raises ValueError if they overlap with pending edits, before anything is queued.
+        """
+        pending = self._pending_edits  # sorted left-to-right
+        for (start, end), _new_bytes in edits:
+            i = bisect_left(pending, (start, end), key=lambda edit: edit[0])
+            if (i > 0 and pending[i - 1][0][1] > start) or (i < len(pending) and pending[i][0][0] < end):
+                raise ValueError(f"edit at {(start, end)} overlaps with a pending edit in batch()")
+        for edit in edits:
+            insort(pending, edit, key=lambda edit: edit[0])
+
+    def _apply_edits(self, edits: List[Tuple[Tuple[int, int], bytes]]):
+        """Apply right-to-left sorted edits to the buffer, the tree and the newline offsets."""
+        buf = self._buf
+        for (start, end), new_bytes in edits:
+            start_point = self._point(start)
+            self.tree.edit(
+                start_byte=start,
+                old_end_byte=end,
+                new_end_byte=start + len(new_bytes),
+                start_point=start_point,
+                old_end_point=self._point(end),
+                new_end_point=_end_point(start_point, new_bytes),
+            )
+            self._splice_newlines(start, end, new_bytes)
+            # slice assignment moves only the tail of the buffer
+            buf[start:end] = new_bytes
+        self._source_bytes = None
+        self._source_string = None
+
+    def _replace_without_reparse(self, edits: List[Tuple[Tuple[int, int], bytes]]) -> bool:
+        """Fast path for _replace_ranges.
+        Edits inside the text of cached words, or inside their quoted id or title values,
+        dont add or remove words, so we patch the cached words with offset arithmetic
+        and defer the reparse until the tree is needed.
+        Returns False if the edits need a reparse.
+        """
+        if self._cached_index is None:
+            return False
+        buf = self._buf
+        # (word, field, new_value) in document order. edits are sorted right-to-left
+        new_values: List[Tuple[Word, str, bytes]] = []
+        own_edits: Dict[int, List[Tuple[Tuple[int, int], bytes]]] = {}
+        for edit in reversed(edits):
+            (start, end), new_bytes = edit
+            w = self.find_word_at_offset(start)
+            if w is None:
+                return False
+            if w.text_range[0] < w.text_range[1] and w.text_range[0] <= start and end <= w.text_range[1]:
+                field = "text"
+                value_start, value_end = w.text_range
+                # tags and entities would change the text node
+                if _TEXT_UNSAFE_RE.search(new_bytes) or _TEXT_UNSAFE_RE.search(buf, start, end):
+                    return False
+            elif w.title_value_range[0] <= start and end <= w.title_value_range[1]:
+                field = "title"
+                value_start, value_end = w.title_value_range
+            elif w.id_value_range[0] <= start and end <= w.id_value_range[1]:
+                field = "id"
+                value_start, value_end = w.id_value_range
+            else:
+                return False
+            if field != "text":
+                # quotes, tags and entities would change the attribute
+                if _ATTR_VALUE_UNSAFE_RE.search(new_bytes) or _ATTR_VALUE_UNSAFE_RE.search(buf, start, end):
+                    return False
+                if value_start == 0 or buf[value_start - 1] not in b"\"'":
+                    # unquoted value
+                    return False
+            if any(w2 is w and f == field for w2, f, _ in new_values):
+                # multiple edits in one value
+                return False
+            value = bytes(buf[value_start:start]) + new_bytes + bytes(buf[end:value_end])
+            if field == "text" and (not value or value[:1].isspace() or value[-1:].isspace()):
+                # html text nodes dont start or end with whitespace
+                return False
+            new_values.append((w, field, value))
+            own_edits.setdefault(id(w), []).append(edit)
+        self._apply_edits(edits)
+        self._tree_stale = True
+        # edited words are replaced with copies, so callers holding the old words
+        # (like the page view) can still compare with the old values.
+        # the words between them are shifted in place
+        words_sorted = self._words_sorted
+        span_starts = self._span_starts
+        span_ends = self._span_ends
+        old_words: List[Word] = []
+        for w, _field, _value in new_values:
+            if not old_words or old_words[-1] is not w:
+                old_words.append(w)
+        indices = [bisect_left(span_starts, w.span_range[0]) for w in old_words]
+        new_words: List[Word] = []
+        delta = 0
+        values = iter(new_values)
+        for n, (i, w) in enumerate(zip(indices, old_words)):
+            word_edits = own_edits[id(w)]
+            nw = copy(w)
+            nw.text_range = _edit_range(w.text_range, word_edits, delta)
+            nw.title_value_range = _edit_range(w.title_value_range, word_edits, delta)
+            nw.id_value_range = _edit_range(w.id_value_range, word_edits, delta)
+            nw.element_range = _edit_range(w.element_range, word_edits, delta)
+            nw.span_range = _edit_range(w.span_range, word_edits, delta)
+            for _edit in word_edits:
+                _w, field, value = next(values)
+                if field == "text":
+                    nw.text = value
+                elif field == "title":
+                    nw.set_title_value(value)
+                else:
+                    nw.id = value
+            for (start, end), new_bytes in word_edits:
+                delta += len(new_bytes) - (end - start)
+            words_sorted[i] = nw
+            span_starts[i], span_ends[i] = nw.span_range
+            new_words.append(nw)
+            next_i = indices[n + 1] if n + 1 < len(indices) else len(words_sorted)
+            self._shift_words(i + 1, next_i, delta)
+        self._update_id_index(old_words, new_words)
+        return True
+
+    def _root_node(self):
+        """Return the root node of the tree. Reparses after deferred edits."""
+        if self._tree_stale:
+            self.tree = self.parser.parse(self._read, self.tree)
+            self._tree_stale = False
+        return self.tree.root_node
+
+    def _read(self, byte_offset: int, point) -> bytes:
+        """Read callback for Parser.parse"""
+        # slice a view, so the chunk is copied once. release the view, so _buf can be resized
+        with memoryview(self._buf) as view:
+            return bytes(view[byte_offset:byte_offset + READ_CHUNK_SIZE])
+
+    def _point(self, offset: int) -> Tuple[int, int]:
+        """Return the (row, column) of a byte offset in source_bytes."""
+        row = self._bisect_newlines(offset)
+        if row == 0:
+            return 0, offset
+        return row, offset - self._newline(row - 1) - 1
+
+    def _newline(self, i: int) -> int:
+        """Return the byte offset of the i-th newline."""
+        if i >= self._newlines_from:
+            return self._newlines[i] + self._newlines_delta
+        return self._newlines[i]
+
+    def _bisect_newlines(self, offset: int) -> int:
+        """Return the number of newlines before offset."""
+        newlines = self._newlines
+        k = self._newlines_from
+        delta = self._newlines_delta
+        if k < len(newlines) and newlines[k] + delta < offset:
+            return bisect_left(newlines, offset - delta, k)
+        return bisect_left(newlines, offset, 0, k)
+
+    def _splice_newlines(self, start: int, end: int, new_bytes: bytes):
+        """Update the newline offsets for replacing start:end with new_bytes."""
+        i = self._bisect_newlines(start)
+        j = self._bisect_newlines(end)
+        inserted = _newline_offsets(new_bytes, start)
+        delta = len(new_bytes) - (end - start)
+        if i == j and not inserted and delta == 0:
+            return
+        # move the lazy shift to j, so only the newlines between the old and the new edit are shifted
+        newlines = self._newlines
+        k = self._newlines_from
+        pending = self._newlines_delta
+        if pending != 0:
+            if j < k:
+                newlines[j:k] = array("q", map((-pending).__add__, newlines[j:k]))
+            elif k < j:
+                newlines[k:j] = array("q", map(pending.__add__, newlines[k:j]))
+        newlines[i:j] = inserted
+        self._newlines_from = i + len(inserted)
+        self._newlines_delta = pending + delta
+
+    def _patch_index(self, edits: List[Tuple[Tuple[int, int], bytes]], changed_ranges):
+        """Update the cached word index after _replace_ranges.
+        Only words in elements touched by the edits or by the changed ranges
+        of the syntax tree are extracted again. Words after them are shifted,
+        words before them are not touched.
+        """
+        # new start offsets of the edits, and the offset delta after each edit.
+        # edits are sorted right-to-left
+        new_starts: List[int] = []
+        deltas: List[int] = []
+        dirty_ranges: List[Tuple[int, int]] = [(r.start_byte, r.end_byte) for r in changed_ranges]
+        delta = 0
+        for (start, end), new_bytes in reversed(edits):
+            new_start = start + delta
+            dirty_ranges.append((new_start, new_start + len(new_bytes)))
+            delta += len(new_bytes) - (end - start)
+            new_starts.append(new_start)
+            deltas.append(delta)
+
+        def edits_delta(count: int) -> int:
+            # the offset delta of the first count edits
+            return deltas[count - 1] if count else 0
+
+        # expand dirty ranges to their enclosing elements, and merge them
+        root = self.tree.root_node
+        dirty_elements: List[Tuple[int, int]] = []
+        for start, end in dirty_ranges:
+            node = root.descendant_for_byte_range(start, end)
+            while node is not None and node.type != "element":
+                node = node.parent
+            if node is None:
+                # edit outside of elements. reindex everything
+                self._cached_index = None
+                return
+            dirty_elements.append((node.start_byte, node.end_byte))
+        dirty_elements.sort()
+        merged: List[List[int]] = []
+        for start, end in dirty_elements:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        # map the dirty elements to the old word indices [lo, hi) which they replace.
+        # all edits are inside dirty elements, so words between them shift by the same delta
+        span_starts = self._span_starts
+        span_ends = self._span_ends
+        groups: List[List[int]] = []  # [new_start, new_end, lo, hi, delta_before, delta_after]
+        for start, end in merged:
+            start_delta = edits_delta(bisect_left(new_starts, start))
+            end_delta = edits_delta(bisect_right(new_starts, end))
+            lo = bisect_right(span_ends, start - start_delta)
+            hi = bisect_left(span_starts, end - end_delta)
+            if groups and lo < groups[-1][3]:
+                # one old word overlaps both elements
+                group = groups[-1]
+                group[1] = end
+                group[3] = max(group[3], hi)
+                group[5] = end_delta
+            else:
+                groups.append([start, end, lo, max(lo, hi), start_delta, end_delta])
+
+        # extract the words of each group, before changing the index
+        sb = self.source_bytes
+        new_words_list: List[List[Word]] = []
+        for start, end, lo, hi, start_delta, end_delta in groups:
+            if lo < hi:
+                # also cover the old words which overlap the dirty elements
+                start = min(start, span_starts[lo] + start_delta)
+                end = max(end, span_ends[hi - 1] + end_delta)
+            node = root.descendant_for_byte_range(start, end)
+            while node is not None and node.type != "element":
+                node = node.parent
+            if node is None:
+                self._cached_index = None
+                return
+            new_words = []
+            for w in self._iter_words(sb, node):
+                w_start, w_end = w.span_range
+                if w_end <= start or end <= w_start:
+                    continue
+                if w_start < start or end < w_end:
+                    # new word reaches over unchanged words. reindex everything
+                    self._cached_index = None
+                    return
+                new_words.append(w)
+            new_words.sort(key=_span_start)
+            new_words_list.append(new_words)
+
+        # right-to-left, so the word indices of the remaining groups stay valid
+        old_words: List[Word] = []
+        next_lo = len(self._words_sorted)
+        for (_start, _end, lo, hi, _start_delta, end_delta), new_words in zip(reversed(groups), reversed(new_words_list)):
+            self._shift_words(hi, next_lo, end_delta)
+            old_words += self._words_sorted[lo:hi]
+            self._splice_words(lo, hi, new_words)
+            next_lo = lo
+        self._update_id_index(old_words, [w for new_words in new_words_list for w in new_words])
+
+    def _shift_words(self, lo: int, hi: int, delta: int):
+        """Shift the ranges of the words lo:hi in _words_sorted by delta."""
+        if delta == 0 or lo >= hi:
+            return
+        for w in self._words_sorted[lo:hi]:
+            # shift in place, so words held by callers stay valid
+            w.text_range = _shift_range(w.text_range, delta)
+            w.title_value_range = _shift_range(w.title_value_range, delta)
+            w.id_value_range = _shift_range(w.id_value_range, delta)
+            w.element_range = _shift_range(w.element_range, delta)
+            w.span_range = _shift_range(w.span_range, delta)
+        self._span_starts[lo:hi] = array("q", map(delta.__add__, self._span_starts[lo:hi]))
+        self._span_ends[lo:hi] = array("q", map(delta.__add__, self._span_ends[lo:hi]))
+
+    def _splice_words(self, lo: int, hi: int, new_words: List[Word]):
+        """Replace the words lo:hi in _words_sorted with new_words, which are in document order."""
+        self._words_sorted[lo:hi] = new_words
+        self._span_starts[lo:hi] = array("q", [w.span_range[0] for w in new_words])
+        self._span_ends[lo:hi] = array("q", [w.span_range[1] for w in new_words])
 
     @print_exceptions
     def find_word_at_offset(self, pos: int) -> Optional[Word]:
-        for word in self.find_words():
-            if word.span_range[0] <= pos < word.span_range[1]:
-                return word
-        return None
+        self._index_words()
+        # word spans dont overlap, so only the last span starting at or before pos can contain pos
+        i = bisect_right(self._span_starts, pos) - 1
+        if i < 0 or pos >= self._span_ends[i]:
+            return None
+        return self._words_sorted[i]
 
 # ------------------------ helpers ------------------------
 
@@ -691,29 +1428,85 @@ r"""
 """
 
 def _detect_lang(source: bytes) -> str:
-    head = source.lstrip()[:2048]
-    if head.startswith(b"<?xml"):
+    # look at the first 2048 bytes after leading whitespace, without copying them
+    m = _NON_WS_RE.search(source)
+    start = m.start() if m else len(source)
+    end = start + 2048
+    if source.startswith(b"<?xml", start):
         return "xml"
     # Heuristic: XHTML often has xmlns with xhtml URI on <html> or top-level
-    if b"http://www.w3.org/1999/xhtml" in head or b"xmlns=" in head:
+    if source.find(b"http://www.w3.org/1999/xhtml", start, end) != -1 or source.find(b"xmlns=", start, end) != -1:
         return "xml"
     return "html"
 
 
-def _strip_quote_range(start: int, end: int, raw: bytes) -> Tuple[int, int]:
-    """Given a node's byte [start,end) and its raw text, return the inner range
-    without surrounding quotes if present."""
-    # note: type(b'"'[0]) == int
-    if (
-        len(raw) >= 2 and
-        (
-            (raw[0] == b'"'[0] and raw[-1] == b'"'[0]) or
-            (raw[0] == b"'"[0] and raw[-1] == b"'"[0])
-        )
-    ):
-        return start + 1, end - 1
-    return start, end
+def _newline_offsets(source: bytes, base: int = 0) -> array:
+    """Return the byte offsets of all newlines in source, plus base."""
+    offsets = array("q")
+    i = source.find(b"\n")
+    while i != -1:
+        offsets.append(base + i)
+        i = source.find(b"\n", i + 1)
+    return offsets
+
+
+def _end_point(start_point: Tuple[int, int], inserted: bytes) -> Tuple[int, int]:
+    """Return the (row, column) after inserting bytes at start_point."""
+    row, column = start_point
+    newlines = inserted.count(b"\n")
+    if newlines == 0:
+        return row, column + len(inserted)
+    return row + newlines, len(inserted) - (inserted.rfind(b"\n") + 1)
+
+
+def _edit_range(byte_range: Tuple[int, int], edits: List[Tuple[Tuple[int, int], bytes]], delta: int) -> Tuple[int, int]:
+    """Map a range of a word through the edits inside that word, then shift it by delta.
+    Edits at the start of the range go into the range, so do edits at its end."""
+    if byte_range == (0, 0):
+        return byte_range
+    range_start, range_end = byte_range
+    start_delta = end_delta = delta
+    for (start, end), new_bytes in edits:
+        edit_delta = len(new_bytes) - (end - start)
+        if range_start > start:
+            start_delta += edit_delta
+        if range_end >= end:
+            end_delta += edit_delta
+    return range_start + start_delta, range_end + end_delta
+
+
+def _span_start(word: Word) -> int:
+    return word.span_range[0]
+
+
+def _shift_range(byte_range: Tuple[int, int], delta: int) -> Tuple[int, int]:
+    if byte_range == (0, 0):
+        # missing attribute
+        return byte_range
+    return byte_range[0] + delta, byte_range[1] + delta
+
+
+def _read_attribute_value(value_node, sb: bytes) -> Tuple[bytes, Tuple[int, int]]:
+    """Returns (value_without_quotes, inner_range)"""
+    start = value_node.start_byte
+    end = value_node.end_byte
+    # strip surrounding quotes. compare ints, so we dont slice the raw value
+    if end - start >= 2 and sb[start] in b"\"'" and sb[end - 1] == sb[start]:
+        start += 1
+        end -= 1
+    return sb[start:end], (start, end)
 
 
 def _class_has(class_attr: bytes, token: bytes) -> bool:
-    return token in class_attr.split()
+    # same as: token in class_attr.split()
+    # but without building a list
+    if class_attr == token:
+        return True
+    n = len(token)
+    i = class_attr.find(token)
+    while i != -1:
+        j = i + n
+        if (i == 0 or class_attr[i - 1] in b" \t\n\r\x0b\f") and (j == len(class_attr) or class_attr[j] in b" \t\n\r\x0b\f"):
+            return True
+        i = class_attr.find(token, j)
+    return False
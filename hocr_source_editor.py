@@ -1,4 +1,5 @@
 import re
+from collections import deque
 from PySide6.QtWidgets import (
     QPlainTextEdit,
 )
@@ -20,7 +21,7 @@ from PySide6.QtCore import (
 from typing import (
     Any,
 )
-from hocr_parser import HocrParser, Word
+from hocr_parser import HocrParser, Word, debug
 
 
 # Operation types
@@ -32,6 +33,54 @@ CHUNK_NORMAL = 0
 CHUNK_TYPING = 1
 CHUNK_DELETE = 2
 
+# same matches as r'\b\w+\b', but also with the pos and endpos arguments
+_WORD_RE = re.compile(r'\w+')
+# chars before the cursor to search for the previous word, doubled until found
+_WORD_WINDOW = 256
+
+# modifier masks for keyPressEvent
+_CTRL_OR_META = Qt.ControlModifier | Qt.MetaModifier
+_CTRL_SHIFT = Qt.ControlModifier | Qt.ShiftModifier
+# undo and redo bindings always use one of these
+_SHORTCUT_MODIFIERS = Qt.ControlModifier | Qt.MetaModifier | Qt.AltModifier
+
+
+def _last_word_start(text: str, end: int) -> int:
+    """Return the start of the last word in text[:end], or -1.
+    hocr files can have very long lines, so search a window before end first.
+    """
+    window = _WORD_WINDOW
+    while True:
+        start = max(0, end - window)
+        m = None
+        for m in _WORD_RE.finditer(text, start, end):
+            pass
+        # a match at the window start can continue before the window
+        if m and (m.start() > start or start == 0):
+            return m.start()
+        if start == 0:
+            return -1
+        window *= 2
+
+
+def _append_op(chunk: list[tuple], op: tuple):
+    """Append op to chunk, or merge it into the last op if they are adjacent,
+    so typing a word gives one op, not one op per character."""
+    if chunk:
+        last_type, last_pos, last_text = chunk[-1]
+        op_type, pos, text = op
+        if op_type == last_type == INSERT and pos == last_pos + len(last_text):
+            chunk[-1] = (INSERT, last_pos, last_text + text)
+            return
+        if op_type == last_type == REMOVE:
+            if pos == last_pos:  # Delete
+                chunk[-1] = (REMOVE, pos, last_text + text)
+                return
+            if pos + len(text) == last_pos:  # Backspace
+                chunk[-1] = (REMOVE, pos, text + last_text)
+                return
+    chunk.append(op)
+
 
 class HocrHighlighter(QSyntaxHighlighter):
     """Syntax highlighter for HOCR source: makes word text stand out"""
@@ -51,24 +100,49 @@ class HocrHighlighter(QSyntaxHighlighter):
             self.word_color = QColor("white")
             self.meta_color = QColor(153, 153, 153)   # ~60% grey
 
-        self.word_re = re.compile(r"<span class='ocrx_word'[^>]*>([^<]+)<")
+        # formats are copied by setFormat, so we can reuse them
+        self.meta_format = QTextCharFormat()
+        self.meta_format.setForeground(self.meta_color)
+        self.word_format = QTextCharFormat()
+        self.word_format.setForeground(self.word_color)
 
     def highlightBlock(self, text: str):
         """Apply formatting to each block (line)."""
 
         # First: gray out the whole line
-        meta_format = QTextCharFormat()
-        meta_format.setForeground(self.meta_color)
-        self.setFormat(0, len(text), meta_format)
+        self.setFormat(0, len(text), self.meta_format)
 
         # Then: apply strong color to word text content
-        for m in self.word_re.finditer(text):
-            start, end = m.span(1)
-            word_format = QTextCharFormat()
-            word_format.setForeground(self.word_color)
+        word_format = self.word_format
+        for start, end in _word_text_spans(text):
             self.setFormat(start, end - start, word_format)
 
 
+_WORD_TAG = "<span class='ocrx_word'"
+
+
+def _word_text_spans(text: str):
+    """Yield the (start, end) of the text of each ocrx_word span in text.
+    Same matches as the regex "<span class='ocrx_word'[^>]*>([^<]+)<",
+    but str.find is faster than the regex engine.
+    """
+    i = text.find(_WORD_TAG)
+    while i != -1:
+        start = text.find(">", i + len(_WORD_TAG)) + 1
+        if start == 0:
+            return
+        end = text.find("<", start)
+        if end == -1:
+            return
+        if end > start:
+            yield start, end
+            # the regex consumes the "<" after the text
+            i = text.find(_WORD_TAG, end + 1)
+        else:
+            # empty text. the regex tries again at the next position
+            i = text.find(_WORD_TAG, i + 1)
+
+
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton
 )
@@ -134,7 +208,11 @@ class HocrSourceEditor(QWidget):
         """Insert escaped text at cursor position and move cursor after it."""
         cursor = self.editor.textCursor()
         pos = cursor.position()
-        cursor.insertText(text)
+        if cursor.hasSelection():
+            # replace the selection, like insertText
+            pos = cursor.selectionStart()
+            self.editor._apply_remove(pos, cursor.selectionEnd() - pos)
+        self.editor._apply_insert(pos, text)
         # Move cursor to just after inserted text
         cursor.setPosition(pos + len(text))
         self.editor.setTextCursor(cursor)
@@ -149,6 +227,8 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
 
     TYPING_TIMEOUT_MS = 500
     DELETE_TIMEOUT_MS = 500
+    SYNC_TIMEOUT_MS = 80
+    UNDO_LIMIT = 1000  # chunks. older chunks are dropped
 
     def __init__(
             self,
@@ -165,6 +245,7 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         self.cursorPositionChanged.connect(self.on_cursor_position_changed)
         self.cursor_sync_cb = cursor_sync_cb
         self._updating = False  # avoid recursive updates
+        self._mirroring = False  # edit is mirrored to the parser by _apply_insert/_apply_remove
         self.setUndoRedoEnabled(False)
 
         self.highlighter = HocrHighlighter(self.document(), self)
@@ -181,8 +262,8 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         QShortcut(QKeySequence("Ctrl+0"), self, activated=self.reset_zoom)
 
         # stacks hold list-of-ops (a chunk)
-        self.undo_stack: list[list[tuple]] = []
-        self.redo_stack: list[list[tuple]] = []
+        self.undo_stack: deque[list[tuple]] = deque(maxlen=self.UNDO_LIMIT)
+        self.redo_stack: deque[list[tuple]] = deque(maxlen=self.UNDO_LIMIT)
 
         # coalescing state
         self._current_typing_chunk: list[tuple] | None = None
@@ -195,26 +276,170 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         self._delete_timer.setSingleShot(True)
         self._delete_timer.timeout.connect(self._commit_delete_chunk)
 
+        # (key, modifiers) -> action, checked first in keyPressEvent
+        self._key_actions = {
+            (Qt.Key_Z, Qt.ControlModifier): self.undo_op, # Ctrl+Z
+            (Qt.Key_Z, _CTRL_SHIFT): self.redo_op, # Ctrl+Shift+Z
+            (Qt.Key_Y, Qt.ControlModifier): self.redo_op, # Ctrl+Y
+        }
+
+        # refresh the page once after a burst of edits
+        self._source_dirty = False  # parser needs set_source_string
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setSingleShot(True)
+        self._sync_timer.timeout.connect(self._do_sync)
+
+        if self._normalize_parser_source():
+            # refresh the page with the new word offsets
+            self._sync_timer.start(self.SYNC_TIMEOUT_MS)
+
     def toBytes(self) -> bytes:
-        return self.toPlainText().encode(self.parser.source_encoding, errors="replace")
+        # the document is authoritative. mirrored edits should give the parser the same bytes
+        self._sync_source()
+        source = self._document_bytes()
+        if source != self.parser.source_bytes:
+            assert not debug, "toBytes: parser source differs from the document"
+            self._resync_source()
+        return source
 
     def setBytes(self, _bytes: bytes):
-        return self.setPlainText(_bytes.decode(self.parser.source_encoding, errors="replace"))
+        """Set the text and the parser source.
+        Parses once, unless the parser source must be normalized to the document text."""
+        self._source_dirty = False
+        self.parser.set_source_bytes(_bytes, self.parser.source_encoding)
+        # the parser already has the new source. dont reparse it on textChanged
+        self._updating = True
+        try:
+            self._set_plain_text(_bytes.decode(self.parser.source_encoding, errors="replace"))
+        finally:
+            self._updating = False
+        self._normalize_parser_source()
+
+    def _document_bytes(self) -> bytes:
+        """Return the document text as bytes, with the same newlines as the parser source."""
+        # toRawText keeps the chars of block.text(), like "\xa0" and "\u2028".
+        # toPlainText replaces them, then the document and the parser would have different offsets
+        text = self.document().toRawText().replace("\u2029", "\n")
+        return text.encode(self.parser.source_encoding, errors="replace")
+
+    def _normalize_parser_source(self) -> bool:
+        """Set the parser source to the document bytes, if they differ.
+        Edits are mirrored to the parser by their position in the document, so both must agree.
+        They differ for sources with invalid bytes, which are shown decoded with errors="replace",
+        or with "\r" line ends, which Qt turns into block breaks.
+        Returns True if the parser source was set.
+        """
+        source = self._document_bytes()
+        if source == self.parser.source_bytes:
+            return False
+        self.parser.set_source_bytes(source, self.parser.source_encoding)
+        return True
+
+    def _set_plain_text(self, text: str):
+        """setPlainText with the highlighter detached.
+        Attaching it again schedules one rehighlight of the new text,
+        so setPlainText returns without highlighting the whole document.
+        """
+        self.highlighter.setDocument(None)
+        try:
+            self.setPlainText(text)
+        finally:
+            self.highlighter.setDocument(self.document())
 
     # ---- low-level apply helpers ----
+    # these also apply the edit to the parser,
+    # so the parser reparses incrementally instead of the whole source.
+    # the parser is edited first: cursorPositionChanged fires inside insertText and removeSelectedText,
+    # and on_cursor_position_changed maps the new cursor position with the newline offsets of the parser
     def _apply_insert(self, pos: int, text: str):
+        self._sync_source()
+        self._check_source_line(pos)
+        start = self._byte_offset(pos)
+        # insertText starts a new block at "\r\n", "\r" and "\u2029"
+        new_text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\u2029", "\n")
+        self.parser.apply_edit(start, start, new_text.encode(self.parser.source_encoding, errors="replace"))
         cur = self.textCursor()
         cur.setPosition(pos)
-        cur.insertText(text)
+        self._mirroring = True
+        try:
+            cur.insertText(text)
+        finally:
+            self._mirroring = False
 
     def _apply_remove(self, pos: int, length: int) -> str:
+        self._sync_source()
+        self._check_source_line(pos)
+        self._check_source_line(pos + length)
+        start = self._byte_offset(pos)
+        end = self._byte_offset(pos + length)
         cur = self.textCursor()
         cur.setPosition(pos)
         cur.setPosition(pos + length, QTextCursor.KeepAnchor)
         removed = cur.selectedText().replace("\u2029", "\n")
-        cur.removeSelectedText()
+        self.parser.apply_edit(start, end, b"")
+        self._mirroring = True
+        try:
+            cur.removeSelectedText()
+        finally:
+            self._mirroring = False
         return removed
 
+    # character positions <-> byte offsets in parser.source_bytes
+    # lines are found with the block lookup of the document and the newline offsets of the parser,
+    # so only one line is encoded or decoded.
+    # qt positions count utf-16 code units, but python strings count code points,
+    # so chars outside the BMP (emoji) count as 2 in qt and as 1 in python
+    def _byte_offset(self, pos: int) -> int:
+        """Return the offset in parser.source_bytes of the character position pos."""
+        block = self.document().findBlock(pos)
+        text = block.text()
+        column = pos - block.position()
+        if text.isascii():
+            prefix = text[:column]
+        else:
+            prefix = text.encode("utf-16-le", "surrogatepass")[:2 * column].decode("utf-16-le", "surrogatepass")
+            if prefix and "\ud800" <= prefix[-1] <= "\udbff" and len(prefix) <= len(text) and text[len(prefix) - 1] != prefix[-1]:
+                # pos splits a surrogate pair. round down to the char
+                prefix = prefix[:-1]
+        return (
+            self.parser.line_offset(block.blockNumber()) +
+            len(prefix.encode(self.parser.source_encoding, errors="replace"))
+        )
+
+    def char_position(self, offset: int) -> int:
+        """Return the character position of the offset in parser.source_bytes."""
+        row, column = self.parser.point(offset)
+        block = self.document().findBlockByNumber(row)
+        if not block.isValid():
+            return self._text_length()
+        text = block.text()
+        if text.isascii():
+            return block.position() + min(column, len(text))
+        line = text.encode(self.parser.source_encoding, errors="replace")
+        try:
+            prefix = line[:column].decode(self.parser.source_encoding)
+        except UnicodeDecodeError:
+            # offset inside a multibyte char. the parser and the document differ
+            self._resync_source()
+            prefix = line[:column].decode(self.parser.source_encoding, errors="ignore")
+        return block.position() + len(prefix.encode("utf-16-le", "surrogatepass")) // 2
+
+    def _check_source_line(self, pos: int):
+        """Resync the parser if its line at pos differs from the document.
+        Edits are mirrored by offsets in this line, so a difference would spread to every later edit.
+        """
+        block = self.document().findBlock(pos)
+        line = block.text().encode(self.parser.source_encoding, errors="replace")
+        if self.parser.line(block.blockNumber()) != line:
+            self._resync_source()
+
+    def _resync_source(self):
+        """Set the parser source to the document bytes, after mirrored edits went wrong."""
+        print("source editor: FIXME parser source differs from the document. reparsing all")
+        self._normalize_parser_source()
+        # refresh the page with the new word offsets
+        self._sync_timer.start(self.SYNC_TIMEOUT_MS)
+
     # ---- commit helpers ----
     def _commit_typing_chunk(self):
         if self._current_typing_chunk:
@@ -238,13 +463,15 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
             self._commit_delete_chunk()  # can’t mix with delete
             if self._current_typing_chunk is None:
                 self._current_typing_chunk = []
-            self._current_typing_chunk.extend(ops)
+            for op in ops:
+                _append_op(self._current_typing_chunk, op)
             self._typing_timer.start(self.TYPING_TIMEOUT_MS)
         elif mode == CHUNK_DELETE:
             self._commit_typing_chunk()  # can’t mix with typing
             if self._current_delete_chunk is None:
                 self._current_delete_chunk = []
-            self._current_delete_chunk.extend(ops)
+            for op in ops:
+                _append_op(self._current_delete_chunk, op)
             self._delete_timer.start(self.DELETE_TIMEOUT_MS)
         else:  # CHUNK_NORMAL
             self._commit_all_chunks()
@@ -256,19 +483,21 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         if not self.undo_stack:
             return
         chunk = self.undo_stack.pop()
-        inverse_chunk: list[tuple] = []
         self._updating = True
+        # one edit block, so the document emits one contentsChange
+        # and the highlighter runs once over the changed blocks, not once per op
+        edit_block = self.textCursor()
+        edit_block.beginEditBlock()
         try:
             for op_type, pos, text in reversed(chunk):
                 if op_type == INSERT:
                     # undo insert → remove
                     self._apply_remove(pos, len(text))
-                    inverse_chunk.append((INSERT, pos, text))
                 elif op_type == REMOVE:
                     # undo remove → insert
                     self._apply_insert(pos, text)
-                    inverse_chunk.append((REMOVE, pos, text))
         finally:
+            edit_block.endEditBlock()
             self._updating = False
         self._sync_parser_and_page()
         self.redo_stack.append(chunk)
@@ -279,6 +508,8 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
             return
         chunk = self.redo_stack.pop()
         self._updating = True
+        edit_block = self.textCursor()
+        edit_block.beginEditBlock()
         try:
             for op_type, pos, text in chunk:
                 if op_type == INSERT:
@@ -286,66 +517,83 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
                 elif op_type == REMOVE:
                     self._apply_remove(pos, len(text))
         finally:
+            edit_block.endEditBlock()
             self._updating = False
         self._sync_parser_and_page()
         self.undo_stack.append(chunk)
 
     def _sync_parser_and_page(self):
-        new_source = self.toPlainText()
-        self.parser.set_source_string(new_source)
+        # the parser was updated by _apply_insert and _apply_remove
+        self._sync_timer.start(self.SYNC_TIMEOUT_MS)
+
+    def _sync_source(self):
+        if not self._source_dirty:
+            return
+        self._source_dirty = False
+        self.parser.set_source_bytes(self._document_bytes(), self.parser.source_encoding)
+
+    def _do_sync(self):
+        self._sync_source()
         self.update_page_cb()
 
+    def flush_sync(self):
+        """Apply a pending sync now, for example before saving."""
+        if self._sync_timer.isActive():
+            self._sync_timer.stop()
+            self._do_sync()
+
     # ---- record ops ----
-    def _record_replace_selection(self, cur, doc_text) -> list[tuple]:
+    def _record_replace_selection(self, cur) -> list[tuple]:
         if not cur.hasSelection():
             return []
-        start, end = sorted([cur.selectionStart(), cur.selectionEnd()])
-        removed_text = doc_text[start:end]
-        self._apply_remove(start, end - start)
+        start, end = cur.selectionStart(), cur.selectionEnd()
+        removed_text = self._apply_remove(start, end - start)
         return [(REMOVE, start, removed_text)]
 
     # ---- key / paste overrides ----
     def keyPressEvent(self, event) -> None:
-        if event.matches(QKeySequence.Undo): # Ctrl+Z
-            self.undo_op()
-            return
-        if event.matches(QKeySequence.Redo) or (
-            event.key() == Qt.Key_Z and event.modifiers() == (Qt.ControlModifier | Qt.ShiftModifier)
-        ) or (
-            event.key() == Qt.Key_Y and event.modifiers() == Qt.ControlModifier # Ctrl+Y
-        ):
-            self.redo_op()
+        key = event.key()
+        modifiers = event.modifiers()
+
+        # common shortcuts. typed characters skip the event.matches lookups
+        action = self._key_actions.get((key, modifiers))
+        if action is not None:
+            action()
             return
+        if modifiers & _SHORTCUT_MODIFIERS:
+            # platform specific bindings, for example Alt+Backspace on windows
+            if event.matches(QKeySequence.Undo):
+                self.undo_op()
+                return
+            if event.matches(QKeySequence.Redo):
+                self.redo_op()
+                return
 
         if self._updating:
             return super().keyPressEvent(event)
 
         cur = self.textCursor()
-        doc_text = self.toPlainText()
         chunk: list[tuple] = []
 
-        key = event.key()
         text = event.text()
-        modifiers = event.modifiers()
 
         # Ctrl+X: Cut selected text
         if event.matches(QKeySequence.Cut):
             if not cur.hasSelection(): return
             # record delete op
-            start, end = sorted([cur.selectionStart(), cur.selectionEnd()])
-            removed_text = doc_text[start:end]
+            start, end = cur.selectionStart(), cur.selectionEnd()
+            self.copy() # update clipboard
+            removed_text = self._apply_remove(start, end - start)
             chunk.append((REMOVE, start, removed_text))
             self._push_chunk(chunk, mode=CHUNK_DELETE)
-            super().cut() # remove text, update clipboard
             self._sync_parser_and_page()
             return
 
         # Ctrl+Backspace: delete previous word
         if key == Qt.Key_Backspace and modifiers & Qt.ControlModifier:
             if cur.position() > 0:
-                start = self._word_start_before_cursor(cur.position(), doc_text)
-                removed_text = doc_text[start:cur.position()]
-                self._apply_remove(start, cur.position() - start)
+                start = self._word_start_before_cursor(cur.position())
+                removed_text = self._apply_remove(start, cur.position() - start)
                 cur.setPosition(start)
                 self.setTextCursor(cur)
                 chunk.append((REMOVE, start, removed_text))
@@ -355,10 +603,9 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
 
         # Ctrl+Delete: delete next word
         if key == Qt.Key_Delete and modifiers & Qt.ControlModifier:
-            if cur.position() < len(doc_text):
-                end = self._word_end_after_cursor(cur.position(), doc_text)
-                removed_text = doc_text[cur.position():end]
-                self._apply_remove(cur.position(), end - cur.position())
+            if cur.position() < self._text_length():
+                end = self._word_end_after_cursor(cur.position())
+                removed_text = self._apply_remove(cur.position(), end - cur.position())
                 chunk.append((REMOVE, cur.position(), removed_text))
                 self._push_chunk(chunk, mode=CHUNK_DELETE)
                 self._sync_parser_and_page()
@@ -368,7 +615,7 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         if key in (Qt.Key_Backspace, Qt.Key_Delete):
             if cur.hasSelection():
                 # selection delete = one big op, flush immediately
-                chunk.extend(self._record_replace_selection(cur, doc_text))
+                chunk.extend(self._record_replace_selection(cur))
                 if chunk:
                     self._push_chunk(chunk, mode=CHUNK_NORMAL)
                     self._sync_parser_and_page()
@@ -376,13 +623,11 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
             else:
                 if key == Qt.Key_Backspace and cur.position() > 0:
                     pos = cur.position() - 1
-                    removed = doc_text[pos:pos+1]
-                    self._apply_remove(pos, 1)
+                    removed = self._apply_remove(pos, 1)
                     chunk.append((REMOVE, pos, removed))
-                elif key == Qt.Key_Delete and cur.position() < len(doc_text):
+                elif key == Qt.Key_Delete and cur.position() < self._text_length():
                     pos = cur.position()
-                    removed = doc_text[pos:pos+1]
-                    self._apply_remove(pos, 1)
+                    removed = self._apply_remove(pos, 1)
                     chunk.append((REMOVE, pos, removed))
             if chunk:
                 self._push_chunk(chunk, mode=CHUNK_DELETE)
@@ -390,16 +635,13 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
             return
 
         # Typing characters
-        if text and not (event.modifiers() & (Qt.ControlModifier | Qt.MetaModifier)):
-            cur = self.textCursor()
-            doc_text = self.toPlainText()
+        if text and not (modifiers & _CTRL_OR_META):
             ops: list[tuple] = []
 
             # if selection exists, delete and reset cursor
             if cur.hasSelection():
-                start, end = sorted([cur.selectionStart(), cur.selectionEnd()])
-                removed_text = doc_text[start:end]
-                self._apply_remove(start, end - start)
+                start, end = cur.selectionStart(), cur.selectionEnd()
+                removed_text = self._apply_remove(start, end - start)
                 ops.append((REMOVE, start, removed_text))
                 cur.setPosition(start) # reset cursor to start of selection
                 self.setTextCursor(cur)
@@ -418,12 +660,11 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         if self._updating:
             return super().insertFromMimeData(source)
         cur = self.textCursor()
-        doc_text = self.toPlainText()
         pasted = source.text()
         if not pasted:
             return
         chunk: list[tuple] = []
-        chunk.extend(self._record_replace_selection(cur, doc_text))
+        chunk.extend(self._record_replace_selection(cur))
         pos = cur.position()
         self._apply_insert(pos, pasted)
         chunk.append((INSERT, pos, pasted))
@@ -431,48 +672,82 @@ class HocrSourceEditorTextEdit(QPlainTextEdit):
         self._sync_parser_and_page()
 
     # ---- helpers for word boundaries ----
-    def _word_start_before_cursor(self, pos: int, text: str) -> int:
+    # words dont span lines, so search line by line
+    # instead of copying the whole document with toPlainText
+    def _word_start_before_cursor(self, pos: int) -> int:
         """Find start of the word before pos."""
         if pos == 0:
             return 0
-        import re
-        matches = list(re.finditer(r'\b\w+\b', text[:pos]))
-        return matches[-1].start() if matches else 0
-
-    def _word_end_after_cursor(self, pos: int, text: str) -> int:
+        block = self.document().findBlock(pos)
+        text = block.text()
+        end = pos - block.position()
+        while True:
+            start = _last_word_start(text, end)
+            if start != -1:
+                return block.position() + start
+            block = block.previous()
+            if not block.isValid():
+                return 0
+            text = block.text()
+            end = len(text)
+
+    def _word_end_after_cursor(self, pos: int) -> int:
         """Find end of the word after pos."""
-        import re
-        matches = list(re.finditer(r'\b\w+\b', text[pos:]))
-        return pos + matches[0].end() if matches else len(text)
+        # search stops at the first match, so this only reads up to the end of the next word
+        block = self.document().findBlock(pos)
+        column = pos - block.position()
+        text = block.text()
+        while True:
+            m = _WORD_RE.search(text, column)
+            if m:
+                return block.position() + m.end()
+            block = block.next()
+            if not block.isValid():
+                return self._text_length()
+            column = 0
+            text = block.text()
+
+    def _text_length(self) -> int:
+        """Return len(self.toPlainText()) without copying the text."""
+        # characterCount includes the last paragraph separator
+        return self.document().characterCount() - 1
 
     # ---- sync from page ----
     def on_text_changed(self):
-        if self._updating:
+        if self._updating or self._mirroring:
             return
-        self._updating = True
-        try:
-            self.parser.set_source_string(self.toPlainText())
-            self.update_page_cb()
-        finally:
-            self._updating = False
+        # edit by QPlainTextEdit, for example drag and drop. reparse all
+        self._source_dirty = True
+        self._sync_timer.start(self.SYNC_TIMEOUT_MS)
 
     def update_from_page(self):
         if self._updating:
             return
+        # the page changed the parser. dont overwrite it with the old text
+        self._source_dirty = False
         self._updating = True
         try:
-            self.setPlainText(self.parser.get_source_string())
+            self._set_plain_text(self.parser.get_source_string())
         finally:
             self._updating = False
+        # the caller refreshes the page
+        self._normalize_parser_source()
 
     def on_cursor_position_changed(self):
         if not self.hasFocus():
             return  # only sync when user is editing here
 
+        self._sync_source()
         cur = self.textCursor()
-        pos = cur.position()
+        # the parser works with byte offsets
+        pos = self._byte_offset(cur.position())
         self.cursor_sync_cb(pos)
 
+    def focusOutEvent(self, event) -> None:
+        # the user goes to the page view. show the last edits there
+        self.flush_sync()
+        super().focusOutEvent(event)
+
     # ---- zoom handlers ----
     def wheelEvent(self, event: QWheelEvent):
         if event.modifiers() & Qt.ControlModifier: